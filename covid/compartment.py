@@ -11,6 +11,9 @@ class CompartmentModel(object):
     As of 4/1/2020 there is no state to these objects, so all method
     are class methods.
     '''
+
+    # Default odeint tolerances, shared by the static and time-varying paths
+    odeint_options = dict(rtol=1e-5, atol=1e-3, mxstep=4000)
     
     @classmethod
     def dx_dt(cls, x, *args):
@@ -20,10 +23,25 @@ class CompartmentModel(object):
 
     
     @classmethod
-    def run(cls, T, x0, theta, **kwargs):
+    def run(cls, T, x0, theta, method='odeint', **kwargs):
         
         # Theta is a tuple of parameters. Entries are 
         # scalars or vectors of length T-1
+        
+        # method is 'odeint' (adaptive) or 'rk4' (fixed step, see _run_rk4;
+        # faster, but only accurate when substeps is large relative to the
+        # rates in theta)
+
+        # Keep state and parameters in one float dtype so the solver does 
+        # not promote the state (e.g., float32 state with float64 params)
+        x0 = np.asarray(x0)
+        theta = tuple(np.asarray(a, dtype=x0.dtype) for a in theta)
+        
+        if method == 'rk4':
+            return cls._run_rk4(T, x0, theta, **kwargs)
+        elif method != 'odeint':
+            raise ValueError(f'Unknown method: {method}')
+        
         is_scalar = [np.ndim(a)==0 for a in theta]
         if onp.all(is_scalar):
             return cls._run_static(T, x0, theta, **kwargs) 
@@ -32,18 +50,20 @@ class CompartmentModel(object):
         
     
     @classmethod
-    def _run_static(cls, T, x0, theta):
+    def _run_static(cls, T, x0, theta, **kwargs):
         '''
         x0 is shape (d,)
         theta is shape (nargs,)
         '''
+        options = dict(cls.odeint_options, **kwargs)
         t = np.arange(T, dtype='float') + 0.
-        return odeint(cls.dx_dt, x0, t, *theta)
+        return odeint(cls.dx_dt, x0, t, *theta, **options)
 
     
     @classmethod
-    def _run_time_varying(cls, T, x0, theta, rtol=1e-5, atol=1e-3, mxstep=4000):
+    def _run_time_varying(cls, T, x0, theta, **kwargs):
         
+        options = dict(cls.odeint_options, **kwargs)
         theta = tuple(np.broadcast_to(a, (T-1,)) for a in theta)
 
         '''
@@ -53,48 +73,61 @@ class CompartmentModel(object):
         t_one_step = np.array([0.0, 1.0])
         
         def advance(x0, theta):
-            x1 = odeint(cls.dx_dt, x0, t_one_step, *theta, rtol=rtol, atol=atol, mxstep=mxstep)[1]
+            x1 = odeint(cls.dx_dt, x0, t_one_step, *theta, **options)[1]
             return x1, x1
 
         # Run T–1 steps of the dynamics starting from the intial distribution
         _, X = jax.lax.scan(advance, x0, theta, T-1)
-        return np.vstack((x0, X))
+        return np.concatenate((x0[None], X))
+    
+    
+    @classmethod
+    def _run_rk4(cls, T, x0, theta, substeps=4):
+        '''
+        Classical Runge-Kutta with a fixed number of substeps per day
+        
+        x0 is shape (d,)
+        entries of theta are scalars or shape (T-1,) (constant within each day)
+        
+        The number of steps is fixed at trace time, so this is a plain 
+        lax.scan: no adaptive while loop, and reverse-mode differentiation 
+        goes straight through the scan. The error grows quickly with the 
+        step size times the largest rate (e.g., beta), so choose substeps
+        for the largest rates expected: 4 is enough for beta around 1, 
+        while beta around 6 needs 16 or more.
+        '''
+        theta = tuple(np.broadcast_to(a, (T-1,)) for a in theta)
+        h = 1. / substeps
+        f = cls.dx_dt
+        
+        def advance(x, inputs):
+            day, theta = inputs
+            
+            def rk4_step(x, t):
+                k1 = f(x, t, *theta)
+                k2 = f(x + h/2 * k1, t + h/2, *theta)
+                k3 = f(x + h/2 * k2, t + h/2, *theta)
+                k4 = f(x + h * k3, t + h, *theta)
+                return x + h/6 * (k1 + 2*k2 + 2*k3 + k4), None
+            
+            x, _ = jax.lax.scan(rk4_step, x, day + h * np.arange(substeps))
+            return x, x
+
+        days = np.arange(T-1, dtype=x0.dtype)
+        _, X = jax.lax.scan(advance, x0, (days, theta))
+        return np.concatenate((x0[None], X))
     
     
     @classmethod
-    def run_batch(cls, T, x0, theta):
+    def run_batch(cls, T, x0, theta, **kwargs):
         '''
         Run dynamics for a batch of (x0, theta) pairs
     
         x0 is shape (batch_sz, d)
         entries of theta are either (batch_sz,) or (batch_sz, T-1)
         '''
-        
-        raise NotImplementedError()  # TODO update given jax bug fix
-        
-        batch_sz, d = x0.shape
-        
-        '''
-        For jax.lax.scan, entries of theta must have size (T-1, batch_sz)
-        '''
-        def expand_and_transpose(a):
-            return np.broadcast_to(a.T, (T-1, batch_sz))
-            
-        theta = tuple(expand_and_transpose(a) for a in theta)
-        
-        t_one_step = np.array([0.0, 1.0])
-        
-        def advance(x0, theta):
-            x1 = self.batch_odeint(x0, t_one_step, *theta)[:,-1,:]
-            return x1, x1
-        
-        _, X = jax.lax.scan(advance, x0, theta, T-1)  # (T-1, batch_sz, d)
-        
-        X = X.swapaxes(0, 1) # --> (batch_sz, T-1, d)
-        
-        X = np.concatenate((x0[:,None,:], X), axis=1)
-        
-        return X
+        run = lambda x0, theta: cls.run(T, x0, theta, **kwargs)
+        return jax.vmap(run)(x0, theta)   # (batch_sz, T, d)
 
     @classmethod
     def R0(cls, theta):
@@ -6,7 +6,7 @@ import numpyro
 import numpyro.distributions as dist
 
 from ..compartment import SEIRDModel
-from .util import observe, ExponentialRandomWalk
+from .util import observe, mask_obs, run_weights, exponential_random_walk, save_trajectory
 from .base import SEIRDBase
 
 import numpy as onp
@@ -18,6 +18,24 @@ SEIRD model
 """
 
 class SEIRD(SEIRDBase):    
+
+    jit_model_args = True
+
+    @property
+    def obs(self):
+        '''Observations with invalid entries filled in, their masks and 
+        their weights for dedupe_obs
+
+        These are computed once here (see mask_obs and run_weights) rather
+        than in every model evaluation.
+        '''
+        obs = super().obs
+        for k in ['confirmed', 'death']:
+            if k in obs:
+                obs[k], obs[k + '_mask'] = mask_obs(obs[k])
+                # The first observation is always observed on its own
+                obs[k + '_weight'] = onp.append(1., run_weights(obs[k][1:], obs[k + '_mask'][1:]))
+        return obs
     
     def __call__(self,
                  T = 50,
@@ -35,11 +53,22 @@ class SEIRD(SEIRDBase):
                  rw_scale = 2e-1,
                  forecast_rw_scale = 0,
                  drift_scale = None,
+                 dedupe_obs = False,
+                 save_full_trajectory=False,
                  confirmed=None,
-                 death=None):
+                 death=None,
+                 confirmed_mask=None,
+                 death_mask=None,
+                 confirmed_weight=None,
+                 death_weight=None):
 
         '''
         Stochastic SEIR model. Draws random parameters and runs dynamics.
+
+        With dedupe_obs=True, each run of unchanged cumulative counts is 
+        observed once, weighted by its length (see run_weights and obs). 
+        Only the C and D trajectories are saved unless 
+        save_full_trajectory=True.
         '''        
                 
         # Sample initial number of infected individuals
@@ -88,25 +117,30 @@ class SEIRD(SEIRDBase):
         # Split observations into first and rest
         confirmed0, confirmed = (None, None) if confirmed is None else (confirmed[0], confirmed[1:])
         death0, death = (None, None) if death is None else (death[0], death[1:])
+        confirmed0_mask, confirmed_mask = (None, None) if confirmed_mask is None else (confirmed_mask[0], confirmed_mask[1:])
+        death0_mask, death_mask = (None, None) if death_mask is None else (death_mask[0], death_mask[1:])
+        confirmed_weight = None if confirmed_weight is None or not dedupe_obs else confirmed_weight[1:]
+        death_weight = None if death_weight is None or not dedupe_obs else death_weight[1:]
 
 
         # First observation
         with numpyro.handlers.scale(scale=0.5):
-            y0 = observe("y0", x0[6], det_prob, det_noise_scale, obs=confirmed0)
+            y0 = observe("y0", x0[6], det_prob, det_noise_scale, obs=confirmed0, mask=confirmed0_mask)
             
         with numpyro.handlers.scale(scale=2.0):
-            z0 = observe("z0", x0[5], det_prob_d, det_noise_scale, obs=death0)
+            z0 = observe("z0", x0[5], det_prob_d, det_noise_scale, obs=death0, mask=death0_mask)
 
         params = (beta0, sigma, gamma, 
                   rw_scale, drift, 
                   det_prob, det_noise_scale, 
                   death_prob, death_rate, det_prob_d)
 
-        beta, x, y, z = self.dynamics(T, params, x0, confirmed=confirmed, death=death)
+        beta, x, y, z = self.dynamics(T, params, x0, confirmed=confirmed, death=death, 
+                                      confirmed_mask=confirmed_mask, death_mask=death_mask,
+                                      confirmed_weight=confirmed_weight, death_weight=death_weight,
+                                      full_trajectory=save_full_trajectory)
 
-        x = np.vstack((x0, x))
-        y = np.append(y0, y)
-        z = np.append(z0, z)
+        xs, ys, zs = [x0[None], x], [np.atleast_1d(y0), y], [np.atleast_1d(z0), z]
 
         if T_future > 0:
 
@@ -116,36 +150,42 @@ class SEIRD(SEIRDBase):
                       death_prob, death_rate, det_prob_d)
 
             beta_f, x_f, y_f, z_f = self.dynamics(T_future+1, params, x[-1,:], 
+                                                  full_trajectory=save_full_trajectory,
                                                   suffix="_future")
 
-            x = np.vstack((x, x_f))
-            y = np.append(y, y_f)
-            z = np.append(z, z_f)
+            xs.append(x_f)
+            ys.append(y_f)
+            zs.append(z_f)
+
+        x = np.concatenate(xs)
+        y = np.concatenate(ys)
+        z = np.concatenate(zs)
 
         return beta, x, y, z, det_prob, death_prob
 
     
-    def dynamics(self, T, params, x0, confirmed=None, death=None, suffix=""):
+    def dynamics(self, T, params, x0, confirmed=None, death=None, confirmed_mask=None, death_mask=None, 
+                 confirmed_weight=None, death_weight=None, full_trajectory=False, suffix=""):
         '''Run SEIRD dynamics for T time steps'''
 
         beta0, sigma, gamma, rw_scale, drift, \
         det_prob, det_noise_scale, death_prob, death_rate, det_prob_d  = params
 
-        beta = numpyro.sample("beta" + suffix,
-                      ExponentialRandomWalk(loc=beta0, scale=rw_scale, drift=drift, num_steps=T-1))
+        beta = exponential_random_walk("beta" + suffix, 
+                                       loc=beta0, scale=rw_scale, drift=drift, num_steps=T-1)
 
         # Run ODE
         x = SEIRDModel.run(T, x0, (beta, sigma, gamma, death_prob, death_rate))
         x = x[1:] # first entry duplicates x0
-        numpyro.deterministic("x" + suffix, x)
+        save_trajectory(x, self.compartments, full=full_trajectory, suffix=suffix)
 
 
         # Noisy observations
         with numpyro.handlers.scale(scale=0.5):
-            y = observe("y" + suffix, x[:,6], det_prob, det_noise_scale, obs = confirmed)
+            y = observe("y" + suffix, x[:,6], det_prob, det_noise_scale, obs = confirmed, mask = confirmed_mask, weight = confirmed_weight)
 
         with numpyro.handlers.scale(scale=2.0):
-            z = observe("z" + suffix, x[:,5], det_prob_d, det_noise_scale, obs = death)
+            z = observe("z" + suffix, x[:,5], det_prob_d, det_noise_scale, obs = death, mask = death_mask, weight = death_weight)
 
         return beta, x, y, z
         
@@ -6,7 +6,7 @@ import numpyro
 import numpyro.distributions as dist
 
 from ..compartment import SEIRDModel
-from .util import observe, observe_nb2, ExponentialRandomWalk, LogisticRandomWalk, frozen_random_walk, clean_daily_obs
+from .util import observe, observe_nb2, mask_obs, ExponentialRandomWalk, LogisticRandomWalk, frozen_random_walk, clean_daily_obs, save_trajectory
 from .base import SEIRDBase, getter
 
 import numpy as onp
@@ -43,11 +43,14 @@ class SEIRD(SEIRDBase):
                  drift_scale = None,
                  num_frozen=0,
                  rw_use_last=1,
+                 save_full_trajectory=False,
                  confirmed=None,
                  death=None):
 
         '''
         Stochastic SEIR model. Draws random parameters and runs dynamics.
+
+        Only the C and D trajectories are saved unless save_full_trajectory=True.
         '''        
                 
         # Sample initial number of infected individuals
@@ -119,13 +122,28 @@ class SEIRD(SEIRDBase):
         else: 
             death0 = death[0]
             death = clean_daily_obs(onp.diff(death))
+
+        # Observation masks are fixed, so build them once here
+        confirmed0, confirmed0_mask = mask_obs(confirmed0)
+        death0, death0_mask = mask_obs(death0)
+
+        # Daily cases and deaths are observed jointly in one stacked site, 
+        # unless only one of them is given: the other is then sampled 
+        # (unobserved) at its own site
+        stack = (confirmed is None) == (death is None)
+        if stack:
+            dyz, dyz_mask = mask_obs(None if confirmed is None else onp.stack((confirmed, death)))
+        else:
+            confirmed, confirmed_mask = mask_obs(confirmed)
+            death, death_mask = mask_obs(death)
+            dyz, dyz_mask = (confirmed, death), (confirmed_mask, death_mask)
         
         # First observation
         with numpyro.handlers.scale(scale=0.5):
-            y0 = observe_nb2("dy0", x0[6], det_prob0, confirmed_dispersion, obs=confirmed0)
+            y0 = observe_nb2("dy0", x0[6], det_prob0, confirmed_dispersion, obs=confirmed0, mask=confirmed0_mask)
             
         with numpyro.handlers.scale(scale=2.0):
-            z0 = observe_nb2("dz0", x0[5], det_prob_d, death_dispersion, obs=death0)
+            z0 = observe_nb2("dz0", x0[5], det_prob_d, death_dispersion, obs=death0, mask=death0_mask)
 
         params = (beta0, 
                   sigma, 
@@ -143,12 +161,13 @@ class SEIRD(SEIRDBase):
                                                 params, 
                                                 x0,
                                                 num_frozen = num_frozen,
-                                                confirmed = confirmed,
-                                                death = death)
+                                                obs = dyz,
+                                                mask = dyz_mask,
+                                                stack = stack,
+                                                full_trajectory = save_full_trajectory)
 
-        x = np.vstack((x0, x))
-        y = np.append(y0, y)
-        z = np.append(z0, z)
+        # x returned by dynamics already starts with x0
+        xs, ys, zs = [x], [np.atleast_1d(y0), y], [np.atleast_1d(z0), z]
 
         if T_future > 0:
 
@@ -167,17 +186,28 @@ class SEIRD(SEIRDBase):
             beta_f, det_rate_rw_f, x_f, y_f, z_f = self.dynamics(T_future+1, 
                                                                  params, 
                                                                  x[-1,:],
+                                                                 full_trajectory=save_full_trajectory,
                                                                  suffix="_future")
 
-            x = np.vstack((x, x_f))
-            y = np.append(y, y_f)
-            z = np.append(z, z_f)
+            xs.append(x_f[1:])
+            ys.append(y_f)
+            zs.append(z_f)
+
+        x = np.concatenate(xs)
+        y = np.concatenate(ys)
+        z = np.concatenate(zs)
 
         return beta, x, y, z, det_prob, death_prob
     
     
-    def dynamics(self, T, params, x0, num_frozen=0, confirmed=None, death=None, suffix=""):
-        '''Run SEIRD dynamics for T time steps'''
+    def dynamics(self, T, params, x0, num_frozen=0, obs=None, mask=None, stack=True, full_trajectory=False, suffix=""):
+        '''
+        Run SEIRD dynamics for T time steps
+
+        With stack=True, obs holds daily confirmed cases and deaths stacked 
+        as shape (2, T-1) and is observed at site dyz. Otherwise obs and
+        mask are (confirmed, death) pairs observed at sites dy and dz.
+        '''
 
         beta0, \
         sigma, \
@@ -206,7 +236,7 @@ class SEIRD(SEIRDBase):
         # Run ODE
         x = SEIRDModel.run(T, x0, (beta, sigma, gamma, death_prob, death_rate))
 
-        numpyro.deterministic("x" + suffix, x[1:])
+        save_trajectory(x[1:], self.compartments, full=full_trajectory, suffix=suffix)
 
         x_diff = np.diff(x, axis=0)
         
@@ -214,13 +244,26 @@ class SEIRD(SEIRDBase):
         new_cases = np.maximum(x_diff[:,6], 0.01)
         new_deaths = np.maximum(x_diff[:,5], 0.01)
         
-        # Noisy observations
-        with numpyro.handlers.scale(scale=0.5):
-            y = observe_nb2("dy" + suffix, new_cases, det_prob, confirmed_dispersion, obs = confirmed)
+        if not stack:
+            (confirmed, death), (confirmed_mask, death_mask) = obs, mask
 
-        with numpyro.handlers.scale(scale=2.0):
-            z = observe_nb2("dz" + suffix, new_deaths, det_prob_d, death_dispersion, obs = death)  
+            with numpyro.handlers.scale(scale=0.5):
+                y = observe_nb2("dy" + suffix, new_cases, det_prob, confirmed_dispersion, obs = confirmed, mask = confirmed_mask)
+
+            with numpyro.handlers.scale(scale=2.0):
+                z = observe_nb2("dz" + suffix, new_deaths, det_prob_d, death_dispersion, obs = death, mask = death_mask)
+
+            return beta, det_prob, x, y, z
+
+        # Noisy observations of cases (row 0, weight 0.5) and deaths (row 1, weight 2.0)
+        latent = np.stack((new_cases, new_deaths))
+        rate = np.stack((det_prob, np.broadcast_to(det_prob_d, det_prob.shape)))
+        dispersion = np.stack((confirmed_dispersion, death_dispersion))[:,None]
+        
+        with numpyro.handlers.scale(scale=onp.array([[0.5], [2.0]])):
+            yz = observe_nb2("dyz" + suffix, latent, rate, dispersion, obs = obs, mask = mask)
 
+        y, z = yz[0], yz[1]
         
         return beta, det_prob, x, y, z
 
@@ -230,8 +273,43 @@ class SEIRD(SEIRDBase):
     
     
 
+    stacked = {'dyz': ['dy', 'dz']}
+
     dy = getter('dy')
     dz = getter('dz')
+
+
+    def _daily_mean(self, samples, c, rate, forecast=False, **args):
+        '''
+        Mean of incident observations, recomputed from the trajectory
+        of compartment c and the detection rate field rate. Fields missing
+        from samples (e.g., the latent det_prob for predictive or forecast
+        samples) are taken from the MCMC samples they were drawn from.
+        '''
+        if self.mcmc_samples is not None:
+            samples = dict(self.mcmc_samples, **samples)
+
+        x = self.get(samples, c, forecast=forecast)
+        
+        if forecast:
+            det = samples[rate + '_future'] if rate + '_future' in samples else samples[rate]
+            prev = self.get(samples, c)[:,-1,None]
+            daily = np.maximum(onp.diff(x, axis=1, prepend=prev), 0.01)
+        else:
+            det = self.combine_samples(samples, rate) if rate + '0' in samples else samples[rate]
+            daily = np.concatenate((x[:,:1], np.maximum(onp.diff(x, axis=1), 0.01)), axis=1)
+        
+        det = det if np.ndim(det) > 1 else det[:,None]
+        return det * daily
+
+    def mean_dy(self, samples, **args):
+        '''Daily confirmed cases mean'''
+        return self._daily_mean(samples, 'C', 'det_prob', **args)
+
+    def mean_dz(self, samples, **args):
+        '''Daily deaths mean'''
+        return self._daily_mean(samples, 'D', 'det_prob_d', **args)
+    
     
     def y0(self, **args):
         return self.z0(**args)
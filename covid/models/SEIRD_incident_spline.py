@@ -8,7 +8,7 @@ import numpyro
 import numpyro.distributions as dist
 
 from ..compartment import SEIRDModel
-from .util import observe_normal, observe, observe_nb2, ExponentialRandomWalk, LogisticRandomWalk, frozen_random_walk, clean_daily_obs
+from .util import observe_normal, observe, observe_nb2, ExponentialRandomWalk, LogisticRandomWalk, frozen_random_walk, clean_daily_obs, save_trajectory
 from .base import SEIRDBase, getter
 
 import numpy as onp
@@ -41,6 +41,7 @@ class SEIRD(SEIRDBase):
                  drift_scale = None,
                  num_frozen=0,
                  rw_use_last=1,
+                 save_full_trajectory=False,
                  confirmed=None,
                  death=None,
                  place_data=None):
@@ -153,10 +154,11 @@ class SEIRD(SEIRDBase):
                                                 x0,
                                                 num_frozen = num_frozen,
                                                 confirmed = confirmed,
-                                                death = death)
+                                                death = death,
+                                                full_trajectory = save_full_trajectory)
 
-        x = np.vstack((x0, x))
-        y = np.append(y0, y)
+        # x returned by dynamics already starts with x0
+        xs, ys = [x], [np.atleast_1d(y0), y]
 
         if T_future > 0:
             d_future={'t':onp.arange(T,T+T_future)}
@@ -178,15 +180,19 @@ class SEIRD(SEIRDBase):
             beta_f, det_rate_rw_f, x_f, y_f = self.dynamics(T_future+1, 
                                                                  params, 
                                                                  x[-1,:],
+                                                                 full_trajectory=save_full_trajectory,
                                                                  suffix="_future")
 
-            x = np.vstack((x, x_f))
-            y = np.append(y, y_f)
+            xs.append(x_f[1:])
+            ys.append(y_f)
+
+        x = np.concatenate(xs)
+        y = np.concatenate(ys)
 
         return beta, x, y, det_prob, death_prob
     
     
-    def dynamics(self, T, params, x0, num_frozen=0, confirmed=None, death=None, suffix=""):
+    def dynamics(self, T, params, x0, num_frozen=0, confirmed=None, death=None, full_trajectory=False, suffix=""):
         '''Run SEIRD dynamics for T time steps'''
 
         beta0, \
@@ -216,7 +222,7 @@ class SEIRD(SEIRDBase):
         # Run ODE
         x = SEIRDModel.run(T, x0, (beta, sigma, gamma, death_prob, death_rate))
 
-        numpyro.deterministic("x" + suffix, x[1:])
+        save_trajectory(x[1:], self.compartments, full=full_trajectory, suffix=suffix)
 
         x_diff = np.diff(x, axis=0)
 
@@ -6,7 +6,7 @@ import numpyro
 import numpyro.distributions as dist
 
 from ..compartment import SEIRDModel
-from .util import observe, ExponentialRandomWalk, LogisticRandomWalk, frozen_random_walk
+from .util import observe, ExponentialRandomWalk, LogisticRandomWalk, frozen_random_walk, save_trajectory
 from .base import SEIRDBase
 
 import numpy as onp
@@ -19,6 +19,8 @@ SEIRD model
 """
 
 class SEIRD(SEIRDBase):    
+
+    jit_model_args = True
     
     def __call__(self,
                  T = 50,
@@ -37,6 +39,7 @@ class SEIRD(SEIRDBase):
                  forecast_rw_scale = 0,
                  drift_scale = None,
                  num_frozen=0,
+                 save_full_trajectory=False,
                  confirmed=None,
                  death=None):
 
@@ -113,11 +116,10 @@ class SEIRD(SEIRDBase):
                                                 x0,
                                                 num_frozen = num_frozen,
                                                 confirmed = confirmed,
-                                                death = death)
+                                                death = death,
+                                                full_trajectory = save_full_trajectory)
 
-        x = np.vstack((x0, x))
-        y = np.append(y0, y)
-        z = np.append(z0, z)
+        xs, ys, zs = [x0[None], x], [np.atleast_1d(y0), y], [np.atleast_1d(z0), z]
 
         if T_future > 0:
 
@@ -135,16 +137,21 @@ class SEIRD(SEIRDBase):
             beta_f, det_rate_rw_f, x_f, y_f, z_f = self.dynamics(T_future+1, 
                                                                  params, 
                                                                  x[-1,:],
+                                                                 full_trajectory=save_full_trajectory,
                                                                  suffix="_future")
 
-            x = np.vstack((x, x_f))
-            y = np.append(y, y_f)
-            z = np.append(z, z_f)
+            xs.append(x_f)
+            ys.append(y_f)
+            zs.append(z_f)
+
+        x = np.concatenate(xs)
+        y = np.concatenate(ys)
+        z = np.concatenate(zs)
 
         return beta, x, y, z, det_prob, death_prob
     
     
-    def dynamics(self, T, params, x0, num_frozen=0, confirmed=None, death=None, suffix=""):
+    def dynamics(self, T, params, x0, num_frozen=0, confirmed=None, death=None, full_trajectory=False, suffix=""):
         '''Run SEIRD dynamics for T time steps'''
 
         beta0, \
@@ -173,7 +180,7 @@ class SEIRD(SEIRDBase):
         # Run ODE
         x = SEIRDModel.run(T, x0, (beta, sigma, gamma, death_prob, death_rate))
         x = x[1:] # first entry duplicates x0
-        numpyro.deterministic("x" + suffix, x)
+        save_trajectory(x, self.compartments, full=full_trajectory, suffix=suffix)
 
 
         # Noisy observations
@@ -8,7 +8,9 @@ from functools import partial
 from ..compartment import SEIRModel
 from ..glm import glm, GLM, log_link, logit_link, Gamma, Beta
 
-from .util import observe, ExponentialRandomWalk, get_future_data
+from .util import observe, exponential_random_walk, get_future_data, save_trajectory, seed_batch, run_batch
+
+_compartments = ['S', 'E', 'I', 'R', 'C']
 
 """
 ************************************************************
@@ -17,7 +19,7 @@ SEIR hierarchical
 """
 
 
-def SEIR_dynamics_hierarchical(T, params, x0, obs = None, use_rw = True, suffix=""):
+def SEIR_dynamics_hierarchical(T, params, x0, obs = None, use_rw = True, full_trajectory = False, suffix=""):
     '''Run SEIR dynamics for T time steps
     
     Uses SEIRModel.run to run dynamics with pre-determined parameters.
@@ -35,22 +37,21 @@ def SEIR_dynamics_hierarchical(T, params, x0, obs = None, use_rw = True, suffix=
     
     if use_rw:
         with numpyro.plate("places", num_places):
-            rw = numpyro.sample("rw" + suffix,
-                                ExponentialRandomWalk(loc = rw_loc,
-                                                      scale = rw_scale,
-                                                      drift = drift, 
-                                                      num_steps = T-1))
+            rw = exponential_random_walk("rw" + suffix,
+                                         loc = rw_loc,
+                                         scale = rw_scale,
+                                         drift = drift, 
+                                         num_steps = T-1)
     else:
         rw = rw_loc
 
     beta *= rw
 
     # Run ODE
-    apply_model = lambda x0, beta, sigma, gamma: SEIRModel.run(T, x0, (beta, sigma, gamma))
-    x = jax.vmap(apply_model)(x0, beta, sigma, gamma)
+    x = run_batch(SEIRModel)(T, x0, (beta, sigma, gamma))
 
     x = x[:,1:,:] # drop first time step from result (duplicates initial value)
-    numpyro.deterministic("x" + suffix, x)
+    save_trajectory(x, _compartments, keep=('C',), full=full_trajectory, suffix=suffix)
    
     # Noisy observations
     y = observe("y" + suffix, x[:,:,4], det_rate, det_noise_scale, obs = obs)
@@ -70,7 +71,8 @@ def SEIR_hierarchical(data = None,
                       rw_scale = 1e-1,
                       det_noise_scale = 0.2,
                       drift_scale = None,
-                      use_obs = False):
+                      use_obs = False,
+                      save_full_trajectory = False):
 
     '''
     Stochastic SEIR model. Draws random parameters and runs dynamics.
@@ -146,7 +148,7 @@ def SEIR_hierarchical(data = None,
     '''
     Run model for each place
     '''
-    x0 = jax.vmap(SEIRModel.seed)(N, I0, E0)
+    x0 = seed_batch(SEIRModel)(N, I0, E0)
     numpyro.deterministic("x0", x0)
     
     # Split observations into first and rest
@@ -160,6 +162,7 @@ def SEIR_hierarchical(data = None,
     params = (beta[:,:-1], sigma, gamma, det_rate, det_noise_scale, rw_loc, rw_scale, drift)
     rw, x, y = SEIR_dynamics_hierarchical(T, params, x0, 
                                           use_rw = use_rw, 
+                                          full_trajectory = save_full_trajectory,
                                           obs = obs)
     
     x = np.concatenate((x0[:,None,:], x), axis=1)
@@ -182,6 +185,7 @@ def SEIR_hierarchical(data = None,
                                                  params, 
                                                  x[:,-1,:], 
                                                  use_rw = use_rw,
+                                                 full_trajectory = save_full_trajectory,
                                                  suffix="_future")
         
         x = np.concatenate((x, x_f), axis=1)
@@ -13,6 +13,9 @@ import matplotlib.pyplot as plt
 import numpy as onp
 from covid.compartment import SEIRDModel
 
+from functools import partial, lru_cache
+import copy
+
 
 '''Utility to define access method for time varying fields'''
 def getter(f):
@@ -21,6 +24,38 @@ def getter(f):
     return get
 
 
+def _mcmc(model, args, num_warmup, num_samples, num_chains, chain_method='vectorized', jit_model_args=False):
+    '''Construct MCMC object for model with arguments args'''
+    
+    # Bind model configuration (T, T_future, ...) statically so the Python
+    # control flow in the model is resolved once at trace time; only the
+    # observations (and place_args with jit_model_args) are passed to run
+    kernel = NUTS(partial(model, **args), 
+                  init_strategy = numpyro.infer.initialization.init_to_median())  
+
+    return MCMC(kernel, 
+                num_warmup=num_warmup, 
+                num_samples=num_samples, 
+                num_chains=num_chains,
+                chain_method=chain_method,
+                jit_model_args=jit_model_args)
+
+
+def _hashable(x):
+    try:
+        hash(x)
+    except TypeError:
+        return False
+    return True
+
+
+@lru_cache(maxsize=8)
+def _cached_mcmc(model_type, args, num_warmup, num_samples, num_chains, chain_method):
+    '''Cached MCMC object for models with jit_model_args'''
+    return _mcmc(model_type(), dict(args), num_warmup, num_samples, num_chains, chain_method, 
+                 jit_model_args=True)
+
+
 """
 ************************************************************
 Base class for models
@@ -44,6 +79,18 @@ class Model():
         'mean_dy': 'daily confirmed (mean)',
         'mean_dz': 'daily deaths (mean)'
     }
+
+    # Set to True in subclasses whose model body only uses jax ops on the
+    # observations, so they can be passed to MCMC as traced arguments
+    jit_model_args = False
+
+    # Arguments that vary from place to place. With jit_model_args they are
+    # passed to the compiled kernel instead of being bound statically
+    place_args = ['N']
+
+    # Sites that observe several fields at once, e.g. {'dyz': ['dy', 'dz']};
+    # see unstack
+    stacked = {}
             
     
     def __init__(self, data=None, mcmc_samples=None, **args):
@@ -67,59 +114,100 @@ class Model():
     ***************************************
     """
     
-    def infer(self, num_warmup=1000, num_samples=1000, num_chains=1, rng_key=PRNGKey(1), **args):
-        '''Fit using MCMC'''
+    def infer(self, num_warmup=1000, num_samples=1000, num_chains=1, chain_method='vectorized', rng_key=PRNGKey(1), **args):
+        '''Fit using MCMC
         
-        args = dict(self.args, **args)
+        Multiple chains are vectorized by default, so all chains run in one
+        compiled kernel instead of compiling one per chain.
         
-        kernel = NUTS(self, init_strategy = numpyro.infer.initialization.init_to_median())  
-
-        mcmc = MCMC(kernel, 
-                    num_warmup=num_warmup, 
-                    num_samples=num_samples, 
-                    num_chains=num_chains)
+        With jit_model_args, the compiled sampler is shared with other 
+        places fit with the same configuration.
+        '''
+        
+        args = dict(self.args, **args)
+        place_args = {}
+
+        if self.jit_model_args:
+            # Places with the same configuration (and hence the same T) share 
+            # one cached MCMC object, so its sampler is only compiled once
+            place_args = {k: args.pop(k) for k in self.place_args if k in args}
+            key = tuple(sorted(args.items()))
+            if _hashable(key):
+                mcmc = _cached_mcmc(type(self), key, 
+                                    num_warmup, num_samples, num_chains, chain_method)
+            else:
+                mcmc = _mcmc(self, args, num_warmup, num_samples, num_chains, chain_method, 
+                             jit_model_args=True)
+        else:
+            mcmc = _mcmc(self, args, num_warmup, num_samples, num_chains, chain_method)
              
-        mcmc.run(rng_key, **self.obs, **args)    
+        mcmc.run(rng_key, **self.obs, **place_args)    
         mcmc.print_summary()
         
-        self.mcmc = mcmc
+        # A cached MCMC object replaces its samples and diagnostics in the 
+        # next fit with the same configuration; the (shallow) copy keeps 
+        # this fit's and still shares the compiled sampler
+        self.mcmc = copy.copy(mcmc)
         self.mcmc_samples = mcmc.get_samples()
     
         return self.mcmc_samples
     
     
-    def prior(self, num_samples=1000, rng_key=PRNGKey(2), **args):
-        '''Draw samples from prior'''
-        predictive = Predictive(self, posterior_samples={}, num_samples=num_samples)        
+    def prior(self, num_samples=1000, rng_key=PRNGKey(2), parallel=False, **args):
+        '''Draw samples from prior (vmapped over samples with parallel=True)'''
+        predictive = Predictive(self, posterior_samples={}, num_samples=num_samples, parallel=parallel)        
         
         args = dict(self.args, **args) # passed args take precedence        
-        self.prior_samples = predictive(rng_key, **args)
+        self.prior_samples = self.unstack(predictive(rng_key, **args))
         
         return self.prior_samples
     
     
-    def predictive(self, rng_key=PRNGKey(3), **args):
+    def _predict(self, rng_key, batch_size=None, parallel=False, **args):
+        '''
+        Run Predictive over the MCMC samples. With batch_size, samples are 
+        drawn batch_size posterior samples at a time and copied into host 
+        arrays, so only one batch is held on the device at once. With 
+        parallel=True, Predictive vmaps over samples instead of looping
+        '''
+        num_samples = len(next(iter(self.mcmc_samples.values())))
+
+        if batch_size is None or batch_size >= num_samples:
+            predictive = Predictive(self, posterior_samples=self.mcmc_samples, parallel=parallel)
+            return self.unstack(predictive(rng_key, **args))
+
+        samples = {}
+        for i, start in enumerate(range(0, num_samples, batch_size)):
+            stop = min(start + batch_size, num_samples)
+            posterior = {k: v[start:stop] for k, v in self.mcmc_samples.items()}
+            predictive = Predictive(self, posterior_samples=posterior, parallel=parallel)
+            batch = predictive(jax.random.fold_in(rng_key, i), **args)
+            for k, v in batch.items():
+                if k not in samples:
+                    samples[k] = onp.empty((num_samples,) + v.shape[1:], dtype=v.dtype)
+                samples[k][start:stop] = v
+
+        return self.unstack(samples)
+
+
+    def predictive(self, rng_key=PRNGKey(3), batch_size=None, parallel=False, **args):
         '''Draw samples from in-sample predictive distribution'''
 
         if self.mcmc_samples is None:
             raise RuntimeError("run inference first")
 
-        predictive = Predictive(self, posterior_samples=self.mcmc_samples)
-
         args = dict(self.args, **args)
-        return predictive(rng_key, **args)
+        return self._predict(rng_key, batch_size=batch_size, parallel=parallel, **args)
     
     
-    def forecast(self, num_samples=1000, rng_key=PRNGKey(4), **args):
+    def forecast(self, num_samples=1000, rng_key=PRNGKey(4), batch_size=None, parallel=False, **args):
         '''Draw samples from forecast predictive distribution'''
 
         if self.mcmc_samples is None:
             raise RuntimeError("run inference first")
 
-        predictive = Predictive(self, posterior_samples=self.mcmc_samples)
-
         args = dict(self.args, **args)
-        return predictive(rng_key, **self.obs, **args)
+        return self._predict(rng_key, batch_size=batch_size, parallel=parallel, **self.obs, **args)
         
             
     def resample(self, low=0, high=90, rw_use_last=1, **kwargs):
@@ -155,6 +243,18 @@ class Model():
     ***************************************
     """    
     
+    def unstack(self, samples):
+        '''Split stacked sites like dyz, dyz_future into dy, dz, dy_future, ...'''
+        
+        for f, fields in self.stacked.items():
+            for suffix in ['', '_future']:
+                if f + suffix in samples:
+                    v = samples.pop(f + suffix)
+                    for i, field in enumerate(fields):
+                        samples[field + suffix] = v[:,i]
+        return samples
+    
+    
     def combine_samples(self, samples, f, use_future=False):
         '''Combine fields like x0, x, x_future into a single array'''
         
@@ -170,9 +270,16 @@ class Model():
         forecast = kwargs.get('forecast', False)
         
         if c in self.compartments:
-            x = samples['x_future'] if forecast else self.combine_samples(samples, 'x')
             j = self.compartments.index(c)
-            return x[:,:,j]
+
+            # Full trajectory only saved with save_full_trajectory=True
+            if ('x_future' if forecast else 'x') in samples:
+                x = samples['x_future'] if forecast else self.combine_samples(samples, 'x')
+                return x[:,:,j]
+
+            if forecast:
+                return samples[c + '_future']
+            return np.concatenate((samples['x0'][:,None,j], samples[c]), axis=1)
         
         else:
             return getattr(self, c)(samples, **kwargs)  # call method named c
@@ -199,8 +306,6 @@ class Model():
     # There are only available in some models but easier to define here
     dz = getter('dz')
     dy = getter('dy')
-    mean_dy = getter('mean_dy')
-    mean_dz = getter('mean_dz')
     
     
     def plot_samples(self,
@@ -225,33 +330,41 @@ class Model():
         
         fields = {f: 0.0 + self.get(samples, f, forecast=forecast)[:,:T] for f in plot_fields}
         names = {f: self.names[f] for f in plot_fields}
+
+        # Reduce all fields at once: stacked is (num_fields, num_samples, T)
+        stacked = onp.stack([onp.asarray(v) for v in fields.values()])
+        
+        lows = [(100.-interval)/2 for interval in intervals]
+        quantiles = onp.percentile(stacked, 
+                                   [50] + [q for low in lows for q in (low, 100.-low)], 
+                                   axis=1)
                 
-        medians = {names[f]: onp.median(onp.array(v), axis=0) for f, v in fields.items()}
+        medians = {names[f]: quantiles[0, i] for i, f in enumerate(fields)}
 
         t = pd.date_range(start=start, periods=T, freq='D')
 
         ax.set_prop_cycle(None)
-        colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
 
-        # Plot medians
-        df = pd.DataFrame(index=t, data=medians)
-        df.plot(ax=ax, legend=legend)
-        median_max = df.max().values
+        # Plot medians; they advance the color cycle (so anything plotted
+        # next, e.g., observations, gets the next color) and samples and 
+        # intervals reuse their colors
+        colors = [ax.plot(t, median, label=name)[0].get_color() for name, median in medians.items()]
+        if legend:
+            ax.legend()
+        median_max = onp.nanmax(quantiles[0], axis=1)
 
         # Plot samples if requested
         if n_samples > 0:
             for i, f in enumerate(fields):
-                df = pd.DataFrame(index=t, data=fields[f][:n_samples,:].T)
-                df.plot(ax=ax, legend=False, alpha=0.1)
+                ax.plot(t, fields[f][:n_samples,:].T, color=colors[i], alpha=0.1)
                 
         # Plot prediction intervals
         pi_max = 10
         handles = []
-        for interval in intervals:
-            low=(100.-interval)/2
-            high=100.-low
-            pred_intervals = {names[f]: onp.percentile(onp.array(v), (low, high), axis=0) for f, v in fields.items()}
-            for i, pi in enumerate(pred_intervals.values()):
+        for k, interval in enumerate(intervals):
+            pred_intervals = quantiles[1+2*k:3+2*k]   # (2, num_fields, T)
+            for i in range(len(fields)):
+                pi = pred_intervals[:,i]
                 h = ax.fill_between(t, pi[0,:], pi[1,:], alpha=0.1, color=colors[i], label=interval)
                 handles.append(h)
                 pi_max = onp.maximum(pi_max, onp.nanmax(pi[1,:]))
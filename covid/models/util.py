@@ -9,6 +9,7 @@ import numpyro.distributions as dist
 import pandas as pd
 
 import warnings
+from functools import lru_cache
 
 
 """
@@ -46,6 +47,19 @@ def frozen_random_walk(name, num_steps=100, num_frozen=10):
     return rw
 
 
+@lru_cache(maxsize=8)
+def _steps(num_steps):
+    '''Time steps 0, ..., num_steps-1 as a (cached) float array'''
+    return onp.arange(num_steps, dtype='float')
+
+
+def _drift(drift, num_steps):
+    '''Cumulative drift of a random walk; skipped when drift is a constant zero'''
+    if isinstance(drift, (int, float)) and drift == 0:
+        return 0.
+    return drift * _steps(num_steps)
+
+
 def ExponentialRandomWalk(loc=1., scale=1e-2, drift=0., num_steps=100):
     '''
     Return distrubtion of exponentiated Gaussian random walk
@@ -61,7 +75,7 @@ def ExponentialRandomWalk(loc=1., scale=1e-2, drift=0., num_steps=100):
         x_t := x_{t-1} * exp(drift + eps_t),    eps_t ~ N(0, scale)        
     '''
     
-    log_loc = np.log(loc) + drift * (np.arange(num_steps)+0.)
+    log_loc = np.log(loc) + _drift(drift, num_steps)
     
     return dist.TransformedDistribution(
         dist.GaussianRandomWalk(scale=scale, num_steps=num_steps),
@@ -71,6 +85,22 @@ def ExponentialRandomWalk(loc=1., scale=1e-2, drift=0., num_steps=100):
         ]
     )
 
+
+def exponential_random_walk(name, loc=1., scale=1e-2, drift=0., num_steps=100):
+    '''
+    Sample an exponentiated Gaussian random walk with the same distribution
+    as ExponentialRandomWalk, built directly from standard normal increments
+    (site name + "_eps") with one cumsum and one exp. The walk itself is
+    recorded as deterministic site name.
+    '''
+    eps = numpyro.sample(name + "_eps",
+                         dist.Normal(0., 1.).expand([num_steps]).to_event(1))
+
+    log_x = np.log(loc) + _drift(drift, num_steps) + scale * np.cumsum(eps, axis=-1)
+
+    return numpyro.deterministic(name, np.exp(log_x))
+
+
 def LogisticRandomWalk(loc=1., scale=1e-2, drift=0., num_steps=100):
     '''
     Return distrubtion of exponentiated Gaussian random walk
@@ -86,7 +116,7 @@ def LogisticRandomWalk(loc=1., scale=1e-2, drift=0., num_steps=100):
         x_t := x_{t-1} * exp(drift + eps_t),    eps_t ~ N(0, scale)
     '''
    
-    logistic_loc = np.log(loc/(1-loc)) + drift * (np.arange(num_steps)+0.)
+    logistic_loc = np.log(loc/(1-loc)) + _drift(drift, num_steps)
    
     return dist.TransformedDistribution(
         dist.GaussianRandomWalk(scale=scale, num_steps=num_steps),
@@ -108,66 +138,115 @@ def observe(*args, **kwargs):
 #    return observe_poisson(*args, **kwargs)
 #    return observe_gamma(*args, **kwargs)
 
-def observe_normal(name, latent, det_rate, det_noise_scale, obs=None):
-    mask = True
+def mask_obs(obs):
+    '''
+    Return (obs, mask) with invalid (non-finite or negative) entries of obs 
+    set to zero. Uses numpy, so this is meant for observations that are 
+    concrete arrays: compute it once outside of the observe_* calls and 
+    pass mask along so it is not rebuilt in every model evaluation.
+    '''
+    if obs is None:
+        return None, True
+    
+    obs = onp.asarray(obs, dtype='float')
+    mask = onp.isfinite(obs) & (obs >= 0)
+    obs = onp.where(mask, obs, 0.0)
+    return obs, mask
+
+
+def obs_runs(obs, mask=None):
+    '''
+    Return the index of the last entry of each run of identical values 
+    in the 1-d (concrete) array obs, and the length of each run. With a
+    mask (see mask_obs), runs also break where the mask changes.
+    '''
+    obs = onp.asarray(obs)
+    change = obs[1:] != obs[:-1]
+    if mask is not None:
+        mask = onp.broadcast_to(mask, obs.shape)
+        change |= mask[1:] != mask[:-1]
+    last = onp.append(change, True)
+    idx = onp.flatnonzero(last)
+    counts = onp.diff(idx, prepend=-1)
+    return idx, counts
+
+
+def run_weights(obs, mask=None):
+    '''
+    Likelihood weights that count each run of identical values in the 1-d 
+    (concrete) array obs once (see obs_runs): the last entry of a run gets 
+    the run length as its weight and the other entries get 0.
+    '''
+    idx, counts = obs_runs(obs, mask)
+    weight = onp.zeros(onp.shape(obs))
+    weight[idx] = counts
+    return weight
+
+
+def observe_normal(name, latent, det_rate, det_noise_scale, obs=None, mask=None, weight=None):
+    '''
+    With weight, the likelihood of each observation is scaled by its weight
+    and entries with weight 0 are left out, e.g., to observe each run of 
+    unchanged cumulative counts once (see run_weights).
+    '''
 
     reg = 0.
     latent = latent + (reg/det_rate)
     
+    if mask is None:
+        mask = True
+        if obs is not None:
+            mask = np.isfinite(obs) & (obs >= 0)
+            obs = np.where(mask, obs, 0.0)
+            
     if obs is not None:
-        mask = np.isfinite(obs) & (obs >= 0)
-        obs = np.where(mask, obs, 0.0)
         obs += reg
-        
-    det_rate = np.broadcast_to(det_rate, latent.shape)
 
+    if weight is None:
+        weight = 1.
+    else:
+        mask = mask & (weight > 0)
+        weight = np.where(weight > 0, weight, 1.)
+        
     mean = det_rate * latent
     scale = det_noise_scale * mean + 1
-    d = dist.TruncatedNormal(0., mean, scale)
-    
-    numpyro.deterministic("mean_" + name, mean)
+    d = dist.TruncatedNormal(low=0., loc=mean, scale=scale)
     
-    with numpyro.handlers.mask(mask=mask):
+    with numpyro.handlers.mask(mask=mask), numpyro.handlers.scale(scale=weight):
         y = numpyro.sample(name, d, obs = obs)
         
     return y
 
 
-def observe_poisson(name, latent, det_prob, obs=None):
+def observe_poisson(name, latent, det_prob, obs=None, mask=None):
 
-    mask = True
-    if obs is not None:
-        mask = np.isfinite(obs) & (obs >= 0)
-        obs = np.where(mask, obs, 0.0)
+    if mask is None:
+        mask = True
+        if obs is not None:
+            mask = np.isfinite(obs) & (obs >= 0)
+            obs = np.where(mask, obs, 0.0)
         
-    det_prob = np.broadcast_to(det_prob, latent.shape)
-
     mean = det_prob * latent
     d = dist.Poisson(mean)    
-    numpyro.deterministic("mean_" + name, mean)
-    
     with numpyro.handlers.mask(mask=mask):
         y = numpyro.sample(name, d, obs = obs)
         
     return y
 
 
-def observe_nb2(name, latent, det_prob, dispersion, obs=None):
+def observe_nb2(name, latent, det_prob, dispersion, obs=None, mask=None):
 
-    mask = True
-    if obs is not None:
-        mask = np.isfinite(obs) & (obs >= 0.0)
-        obs = np.where(mask, obs, 0.0)
+    if mask is None:
+        mask = True
+        if obs is not None:
+            mask = np.isfinite(obs) & (obs >= 0.0)
+            obs = np.where(mask, obs, 0.0)
 
     # --> gives error with newer jax/numpyro (on swarm2, with numpyro.enable_x64())
     #if onp.any(np.logical_not(mask)):
     #    warnings.warn('Some observed values are invalid')
                 
-    det_prob = np.broadcast_to(det_prob, latent.shape)
-
     mean = det_prob * latent
-    numpyro.deterministic("mean_" + name, mean)
-    
     d = NB2(mu=mean, k=dispersion)
     
     with numpyro.handlers.mask(mask=mask):
@@ -175,6 +254,34 @@ def observe_nb2(name, latent, det_prob, dispersion, obs=None):
         
     return y
 
+@lru_cache(maxsize=None)
+def seed_batch(model):
+    '''
+    Batched model.seed for compartment model class model; jitted and
+    built once per class rather than in every model evaluation
+    '''
+    return jax.jit(jax.vmap(model.seed))
+
+
+@lru_cache(maxsize=None)
+def run_batch(model):
+    '''Jitted model.run_batch (T is static), built once per class'''
+    return jax.jit(model.run_batch, static_argnums=0)
+
+
+def save_trajectory(x, compartments, keep=('C', 'D'), full=False, suffix=""):
+    '''
+    Record the compartment trajectory x (last axis indexes compartments).
+    By default only the compartments in keep are saved, as sites named by
+    the compartment (e.g., "C", "C_future"); with full=True the whole
+    trajectory is saved as site "x"
+    '''
+    if full:
+        numpyro.deterministic("x" + suffix, x)
+    else:
+        for c in keep:
+            numpyro.deterministic(c + suffix, x[..., compartments.index(c)])
+
 
 """
 ************************************************************
@@ -231,10 +231,12 @@ def run_place(data,
               resample_low=0,
               resample_high=100,
               save_fields=['beta0', 'beta', 'sigma', 'gamma', 'dy0', 'dy', 'dy_future', 'dz0', 'dz', 'dz_future', 'y0', 'y', 'y_future', 'z0', 'z', 'z_future' ],
+              x64=True,
+              batch_size=None,
               **kwargs):
 
 
-    numpyro.enable_x64()
+    numpyro.enable_x64(x64)
 
     print(f"Running {place} (start={start}, end={end})")
     place_data = data[place]['data'][start:end]
@@ -249,7 +251,8 @@ def run_place(data,
     
     print(" * running MCMC")
     mcmc_samples = model.infer(num_warmup=num_warmup, 
-                               num_samples=num_samples)
+                               num_samples=num_samples,
+                               num_chains=num_chains)
 
     if resample_low > 0 or resample_high < 100:
         print(" * resampling")
@@ -263,11 +266,11 @@ def run_place(data,
 
     # In-sample posterior predictive samples (don't condition on observations)
     print(" * collecting in-sample predictive samples")
-    post_pred_samples = model.predictive()
+    post_pred_samples = model.predictive(batch_size=batch_size)
 
     # Forecasting posterior predictive (do condition on observations)
     print(" * collecting forecast samples")
-    forecast_samples = model.forecast(T_future=T_future)
+    forecast_samples = model.forecast(T_future=T_future, batch_size=batch_size)
         
     if save:
 
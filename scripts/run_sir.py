@@ -1,10 +1,7 @@
 import numpyro
-numpyro.enable_x64()
 
 import sys
 import argparse
-import covid.util as util
-import configs
 import numpy as onp
 
 #test
@@ -18,10 +15,22 @@ if __name__ == "__main__":
     parser.add_argument('--prefix', help='path prefix for saving results', default='results')
     parser.add_argument('--no-run', help="don't run the model (only do vis)", dest='run', action='store_false')
     parser.add_argument('--config', help='model configuration name', default='SEIRD')
-    parser.set_defaults(run=True)
+    parser.add_argument('--platform', help='jax platform to run on (cpu, gpu or tpu)', default=None)
+    parser.add_argument('--float32', help='use single precision (default: double)', dest='x64', action='store_false')
+    parser.set_defaults(run=True, x64=True)
 
     args = parser.parse_args()
 
+    # Platform and precision must be set before the jax backend starts,
+    # which importing covid (e.g., its PRNGKey defaults) already does
+    numpyro.enable_x64(args.x64)
+
+    if args.platform is not None:
+        numpyro.set_platform(args.platform)
+
+    import covid.util as util
+    import configs
+
     if args.config not in dir(configs):
         print(f'Invalid config: {args.config}. Options are {dir(configs)}')
         exit()
@@ -700,6 +709,7 @@ if __name__ == "__main__":
                        end=args.end,
                        prefix=args.prefix,
                        model_type=config['model'],
+                       x64=args.x64,
                        **config['args'])
     
     util.gen_forecasts(data,
@@ -0,0 +1,56 @@
+import numpy as onp
+import pandas as pd
+
+import numpyro
+numpyro.enable_x64()
+from numpyro.handlers import seed, trace
+
+import covid.models.SEIRD
+from covid.models.base import _cached_mcmc
+
+
+def make_model(T=20):
+    rng = onp.random.RandomState(0)
+    # Cumulative counts that stay unchanged on some days
+    confirmed = onp.cumsum(rng.poisson(50, T) * (rng.rand(T) > 0.3)).astype(float)
+    death = onp.cumsum(rng.poisson(2, T)).astype(float)
+    data = pd.DataFrame({'confirmed': confirmed, 'death': death},
+                        index=pd.date_range('2020-03-04', periods=T))
+    return covid.models.SEIRD.SEIRD(data=data, T=T, N=1e6)
+
+
+def test_dedupe_obs_keeps_full_length_sites():
+    T, T_future = 20, 5
+    model = make_model(T)
+    obs = model.obs
+
+    assert obs['confirmed_weight'][0] == 1
+    assert obs['confirmed_weight'][1:].sum() == T-1
+
+    tr = trace(seed(model, 0)).get_trace(T=T, N=1e6, T_future=T_future, dedupe_obs=True, **obs)
+    assert tr['y']['value'].shape == (T-1,)
+    assert tr['z']['value'].shape == (T-1,)
+    assert tr['y_future']['value'].shape == (T_future,)
+
+    # Entries inside a run are masked out, run ends are weighted
+    weight = obs['confirmed_weight'][1:]
+    site = tr['y']
+    assert onp.all((site['fn'].log_prob(site['value']) != 0) == (weight > 0))
+    assert onp.array_equal(onp.asarray(tr['y']['scale']), 0.5 * onp.where(weight > 0, weight, 1.))
+
+
+def test_cached_mcmc_keeps_each_fit():
+    T = 20
+    model1, model2 = make_model(T), make_model(T)
+    model2.data = model2.data * 2
+
+    hits = _cached_mcmc.cache_info().hits
+    model1.infer(num_warmup=10, num_samples=10)
+    model2.infer(num_warmup=10, num_samples=10)
+
+    # The second fit reuses the cached sampler, but each keeps its own samples
+    assert _cached_mcmc.cache_info().hits == hits + 1
+    for k, v in model1.mcmc.get_samples().items():
+        assert onp.array_equal(v, model1.mcmc_samples[k])
+    assert not onp.array_equal(model1.mcmc.get_samples()['beta0'], 
+                               model2.mcmc.get_samples()['beta0'])
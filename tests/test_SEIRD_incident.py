@@ -0,0 +1,52 @@
+import numpy as onp
+import pandas as pd
+
+import numpyro
+numpyro.enable_x64()
+from numpyro.handlers import seed, trace
+
+import covid.models.SEIRD_incident
+
+
+def make_model(T=20):
+    rng = onp.random.RandomState(0)
+    data = pd.DataFrame({'confirmed': onp.cumsum(rng.poisson(50, T)).astype(float),
+                         'death': onp.cumsum(rng.poisson(2, T)).astype(float)},
+                        index=pd.date_range('2020-03-04', periods=T))
+    return covid.models.SEIRD_incident.SEIRD(data=data, T=T, N=1e6)
+
+
+def test_mean_dy_from_predictive_samples():
+    T = 20
+    model = make_model(T)
+    model.infer(num_warmup=20, num_samples=20)
+
+    post_pred_samples = model.predictive()
+
+    # det_prob is only in the MCMC samples
+    assert 'det_prob' not in post_pred_samples
+
+    mean_dy = model.get(post_pred_samples, 'mean_dy')
+    mean_dz = model.get(post_pred_samples, 'mean_dz')
+    assert mean_dy.shape == (20, T)
+    assert mean_dz.shape == (20, T)
+
+    merged = dict(model.mcmc_samples, **post_pred_samples)
+    assert onp.allclose(mean_dy, model.get(merged, 'mean_dy'))
+
+
+def test_unobserved_series_is_sampled():
+    T = 20
+    model = make_model(T)
+    obs = model.obs
+
+    tr = trace(seed(model, 0)).get_trace(T=T, N=1e6, confirmed=obs['confirmed'])
+
+    # With only confirmed cases given, deaths are drawn at their own site
+    assert 'dyz' not in tr
+    assert tr['dy']['is_observed']
+    assert not tr['dz']['is_observed']
+    assert tr['dz']['value'].shape == (T-1,)
+
+    tr = trace(seed(model, 0)).get_trace(T=T, N=1e6, **obs)
+    assert tr['dyz']['is_observed']
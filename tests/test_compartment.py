@@ -0,0 +1,35 @@
+import numpy as onp
+import pytest
+
+import numpyro
+numpyro.enable_x64()
+import jax.numpy as np
+
+from covid.compartment import SEIRDModel
+
+
+def run_seird(beta, T=100, N=1e6, **kwargs):
+    x0 = SEIRDModel.seed(N=N, I=100., E=100., H=0., D=0.)
+    theta = (np.full(T-1, beta), 1/5.5, 1/3.6, 0.01, 1/10.)
+    return SEIRDModel.run(T, x0, theta, **kwargs)
+
+
+@pytest.mark.parametrize('beta', [0.5, 1., 3., 6.])
+def test_run_matches_odeint(beta):
+    N = 1e6
+    x = run_seird(beta, N=N, method='odeint')
+
+    assert onp.array_equal(run_seird(beta, N=N), x)
+
+    # Fixed-step RK4 with enough substeps for the largest beta
+    x_rk4 = run_seird(beta, N=N, method='rk4', substeps=16)
+    assert x_rk4.shape == x.shape
+    assert onp.max(onp.abs(x_rk4 - x)) / N < 1e-4
+
+
+@pytest.mark.parametrize('beta', [0.5, 1.])
+def test_rk4_default_substeps_at_moderate_beta(beta):
+    N = 1e6
+    x = run_seird(beta, N=N, method='odeint')
+    x_rk4 = run_seird(beta, N=N, method='rk4')
+    assert onp.max(onp.abs(x_rk4 - x)) / N < 1e-4
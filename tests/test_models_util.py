@@ -0,0 +1,85 @@
+import numpy as onp
+
+import numpyro
+numpyro.enable_x64()
+import numpyro.distributions as dist
+from numpyro.handlers import seed, trace
+from numpyro.infer import Predictive
+from numpyro.infer.util import log_density
+
+import jax.numpy as np
+from jax.random import PRNGKey
+
+from covid.models.util import mask_obs, obs_runs, run_weights, observe_normal, \
+    ExponentialRandomWalk, exponential_random_walk
+
+
+def test_obs_runs():
+    obs = onp.array([1., 1., 2., 2., 2., 3., 3.])
+    idx, counts = obs_runs(obs)
+    assert list(idx) == [1, 4, 6]
+    assert list(counts) == [2, 3, 2]
+
+    # Runs also break where the mask changes
+    obs, mask = mask_obs([1., 1., onp.nan, onp.nan, 0., 5.])
+    idx, counts = obs_runs(obs, mask)
+    assert list(idx) == [1, 3, 4, 5]
+    assert list(counts) == [2, 2, 1, 1]
+
+    weight = run_weights(obs, mask)
+    assert list(weight) == [0, 2, 0, 2, 1, 1]
+
+
+def test_weighted_likelihood():
+    obs, mask = mask_obs([1., 1., 1., onp.nan, 4., 4., 7.])
+    latent = np.array([1., 1.5, 2., 3., 4., 5., 6.])
+    weight = run_weights(obs, mask)
+
+    def model(weight=None):
+        return observe_normal("y", latent, 0.5, 0.15, obs=obs, mask=mask, weight=weight)
+
+    tr = trace(seed(model, 0)).get_trace(weight=weight)
+    assert tr["y"]["value"].shape == obs.shape
+
+    # Each valid run is observed once at its last entry, weighted by its length
+    mean = 0.5 * latent
+    d = dist.TruncatedNormal(low=0., loc=mean, scale=0.15 * mean + 1)
+    expected = onp.sum((weight * d.log_prob(obs))[mask])
+    assert onp.allclose(log_density(model, (weight,), {}, {})[0], expected)
+
+    # Without weights every valid entry counts once
+    expected = onp.sum(d.log_prob(obs)[mask])
+    assert onp.allclose(log_density(model, (), {}, {})[0], expected)
+
+
+def test_exponential_random_walk_matches_distribution():
+    loc, scale, drift, num_steps, n = 0.5, 0.2, 0.03, 10, 20000
+
+    def model():
+        exponential_random_walk("rw", loc=loc, scale=scale, drift=drift, num_steps=num_steps)
+
+    log_x = onp.log(Predictive(model, num_samples=n)(PRNGKey(0))["rw"])
+    log_y = onp.log(ExponentialRandomWalk(loc=loc, scale=scale, drift=drift, 
+                                          num_steps=num_steps).sample(PRNGKey(1), (n,)))
+    assert log_x.shape == log_y.shape == (n, num_steps)
+
+    # Per step, the log walk has mean log(loc) + drift*t and variance scale^2*(t+1)
+    t = onp.arange(num_steps)
+    mean, var = onp.log(loc) + drift * t, scale**2 * (t + 1)
+    for log_walk in [log_x, log_y]:
+        assert onp.allclose(log_walk.mean(0), mean, atol=0.02)
+        assert onp.allclose(log_walk.var(0), var, rtol=0.05)
+
+
+def test_exponential_random_walk_in_plate():
+    num_places, T = 3, 8
+
+    def model():
+        with numpyro.plate("places", num_places):
+            rw = exponential_random_walk("rw", loc=1., scale=0.1, num_steps=T-1)
+            # Continue each place's walk from its last value, as in forecasts
+            exponential_random_walk("rw_future", loc=rw[:,-1,None], scale=0.1, num_steps=T-1)
+
+    tr = trace(seed(model, 0)).get_trace()
+    assert tr["rw"]["value"].shape == (num_places, T-1)
+    assert tr["rw_future"]["value"].shape == (num_places, T-1)